@@ -3,7 +3,8 @@ import pandas as pd
 import requests
 import datetime
 import time
-from PIL import Image
+from collections import deque
+from pump_core import DEV, device_up, fetch_json, get_http_session
 
 # Page configuration
 st.set_page_config(
@@ -63,39 +64,56 @@ st.markdown("""
 st.title("💧 Smart Pump Controller")
 st.markdown("Control your water pump remotely and monitor soil moisture levels.")
 
-# Device configuration (replace with your ESP8266 IP)
-ESP8266_IP = "192.168.1.100"
-PUMP_ON_URL = f"http://{ESP8266_IP}/pump_on"
-PUMP_OFF_URL = f"http://{ESP8266_IP}/pump_off"
-STATUS_URL = f"http://{ESP8266_IP}/status"
-MOISTURE_URL = f"http://{ESP8266_IP}/moisture"
-
 # Initialize session state variables
 if 'pump_status' not in st.session_state:
     st.session_state.pump_status = "OFF"
 if 'schedules' not in st.session_state:
-    st.session_state.schedules = pd.DataFrame(columns=["Day", "Start Time", "End Time", "Duration", "Enabled"])
+    st.session_state.schedules = []
 if 'alarms' not in st.session_state:
     st.session_state.alarms = []
 if 'moisture_level' not in st.session_state:
     st.session_state.moisture_level = 0
 if 'moisture_history' not in st.session_state:
-    st.session_state.moisture_history = pd.DataFrame(columns=["Timestamp", "Moisture"])
+    st.session_state.moisture_history = deque(maxlen=100)
+if 'last_update' not in st.session_state:
+    st.session_state.last_update = None
+
+# Clicks of the same action closer together than this are coalesced into one request
+DEBOUNCE_SECONDS = 0.5
+
+# Function to check whether an action was already triggered within the debounce window
+def is_debounced(action):
+    now = time.monotonic()
+    key = f"_last_{action}"
+    if now - st.session_state.get(key, float("-inf")) < DEBOUNCE_SECONDS:
+        return True
+    st.session_state[key] = now
+    return False
 
 # Function to control pump
 def control_pump(action):
+    if is_debounced(f"pump_{action}"):
+        return
+    if not device_up(DEV.ip):
+        # The cached probe is shared by all sessions; re-probe before refusing an explicit command
+        device_up.clear()
+        if not device_up(DEV.ip):
+            st.error("Error communicating with device: device is offline")
+            return
     try:
         if action == "ON":
-            response = requests.get(PUMP_ON_URL, timeout=5)
+            response = get_http_session().get(DEV.pump_on_url, timeout=5)
             if response.status_code == 200:
                 st.session_state.pump_status = "ON"
+                fetch_json.clear()
                 st.success("Pump turned ON successfully")
             else:
                 st.error("Failed to turn ON pump")
         else:
-            response = requests.get(PUMP_OFF_URL, timeout=5)
+            response = get_http_session().get(DEV.pump_off_url, timeout=5)
             if response.status_code == 200:
                 st.session_state.pump_status = "OFF"
+                fetch_json.clear()
                 st.success("Pump turned OFF successfully")
             else:
                 st.error("Failed to turn OFF pump")
@@ -104,40 +122,34 @@ def control_pump(action):
 
 # Function to get device status
 def get_device_status():
+    if not device_up(DEV.ip):
+        st.error("Error getting device status: device is offline")
+        return
     try:
         # Get pump status
-        response = requests.get(STATUS_URL, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            st.session_state.pump_status = data.get("pump_status", "OFF")
+        data = fetch_json(DEV.status_url)
+        st.session_state.pump_status = data.get("pump_status", "OFF")
         
         # Get moisture level
-        response = requests.get(MOISTURE_URL, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            moisture = data.get("moisture", 0)
-            st.session_state.moisture_level = moisture
-            
-            # Add to history (keep last 100 readings)
-            new_entry = pd.DataFrame({
-                "Timestamp": [datetime.datetime.now()],
-                "Moisture": [moisture]
-            })
-            st.session_state.moisture_history = pd.concat(
-                [st.session_state.moisture_history, new_entry]
-            ).tail(100)
+        data = fetch_json(DEV.moisture_url)
+        moisture = data.get("moisture", 0)
+        now = datetime.datetime.now()
+        st.session_state.moisture_level = moisture
+        st.session_state.last_update = now
+        
+        # Add to history (deque keeps the last 100 readings)
+        st.session_state.moisture_history.append((now, moisture))
             
     except Exception as e:
         st.error(f"Error getting device status: {str(e)}")
 
+# Moisture status classes, indexed by how many thresholds (30, 60) the level exceeds
+MOISTURE_CLASSES = ("moisture-danger", "moisture-warning", "moisture-good")
+MOISTURE_HTML = '<div class="{} moisture-level">{}%</div>'.format
+
 # Function to get moisture status class
 def get_moisture_class(level):
-    if level > 60:
-        return "moisture-good"
-    elif level > 30:
-        return "moisture-warning"
-    else:
-        return "moisture-danger"
+    return MOISTURE_CLASSES[(level > 30) + (level > 60)]
 
 # Function to add schedule
 def add_schedule():
@@ -146,23 +158,21 @@ def add_schedule():
     end_time = st.session_state.new_schedule_end
     enabled = st.session_state.new_schedule_enabled
     
-    duration = (datetime.datetime.combine(datetime.date.today(), end_time) - 
-                datetime.datetime.combine(datetime.date.today(), start_time)).seconds // 60
+    # Minutes from start to end, wrapping past midnight for overnight schedules
+    duration = (end_time.hour * 60 + end_time.minute - start_time.hour * 60 - start_time.minute) % (24 * 60)
     
-    new_schedule = pd.DataFrame([{
+    st.session_state.schedules.append({
         "Day": day,
         "Start Time": start_time.strftime("%H:%M"),
         "End Time": end_time.strftime("%H:%M"),
         "Duration": f"{duration} minutes",
         "Enabled": enabled
-    }])
-    
-    st.session_state.schedules = pd.concat([st.session_state.schedules, new_schedule], ignore_index=True)
+    })
     st.success("Schedule added successfully!")
 
 # Function to delete schedule
 def delete_schedule(index):
-    st.session_state.schedules = st.session_state.schedules.drop(index).reset_index(drop=True)
+    st.session_state.schedules.pop(index)
     st.success("Schedule deleted successfully!")
 
 # Function to add alarm
@@ -184,11 +194,7 @@ with col1:
     st.markdown("### Soil Moisture Level")
     with st.container():
         moisture_class = get_moisture_class(st.session_state.moisture_level)
-        st.markdown(f"""
-        <div class="{moisture_class} moisture-level">
-            {st.session_state.moisture_level}%
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(MOISTURE_HTML(moisture_class, st.session_state.moisture_level), unsafe_allow_html=True)
         
         # Moisture status indicator
         if st.session_state.moisture_level > 60:
@@ -199,7 +205,9 @@ with col1:
             st.error("Soil moisture level is low - consider watering")
         
         # Refresh button
-        if st.button("Refresh Moisture Level", key="btn_refresh_moisture"):
+        if st.button("Refresh Moisture Level", key="btn_refresh_moisture") and not is_debounced("refresh"):
+            device_up.clear()
+            fetch_json.clear()
             get_device_status()
     
     # Pump control card
@@ -217,14 +225,17 @@ with col1:
                 control_pump("OFF")
         
         # Status refresh
-        if st.button("Refresh Status", key="btn_refresh"):
+        if st.button("Refresh Status", key="btn_refresh") and not is_debounced("refresh"):
+            device_up.clear()
+            fetch_json.clear()
             get_device_status()
 
     # Alarm settings
     st.markdown("### Alarm Settings")
     with st.container():
-        st.time_input("Set Alarm Time", key="new_alarm_time")
-        st.button("Add Alarm", on_click=add_alarm)
+        with st.form("alarm_form"):
+            st.time_input("Set Alarm Time", key="new_alarm_time")
+            st.form_submit_button("Add Alarm", on_click=add_alarm)
         
         if st.session_state.alarms:
             st.markdown("**Active Alarms:**")
@@ -236,9 +247,10 @@ with col1:
 with col2:
     # Moisture history chart
     st.markdown("### Moisture History")
-    if not st.session_state.moisture_history.empty:
+    if st.session_state.moisture_history:
+        timestamps, levels = zip(*st.session_state.moisture_history)
         st.line_chart(
-            st.session_state.moisture_history.set_index('Timestamp')['Moisture'],
+            pd.Series(levels, index=timestamps, name="Moisture"),
             use_container_width=True
         )
     else:
@@ -250,22 +262,23 @@ with col2:
         # Schedule form
         days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday", "Everyday"]
         
-        cols = st.columns(3)
-        with cols[0]:
-            st.selectbox("Day", days, key="new_schedule_day")
-        with cols[1]:
-            st.time_input("Start Time", key="new_schedule_start")
-        with cols[2]:
-            st.time_input("End Time", key="new_schedule_end")
-        
-        st.checkbox("Enable Schedule", value=True, key="new_schedule_enabled")
-        st.button("Add Schedule", on_click=add_schedule)
+        with st.form("schedule_form"):
+            cols = st.columns(3)
+            with cols[0]:
+                st.selectbox("Day", days, key="new_schedule_day")
+            with cols[1]:
+                st.time_input("Start Time", key="new_schedule_start")
+            with cols[2]:
+                st.time_input("End Time", key="new_schedule_end")
+            
+            st.checkbox("Enable Schedule", value=True, key="new_schedule_enabled")
+            st.form_submit_button("Add Schedule", on_click=add_schedule)
         
         # Display schedules
-        if not st.session_state.schedules.empty:
+        if st.session_state.schedules:
             st.markdown("**Active Schedules:**")
             
-            for i, row in st.session_state.schedules.iterrows():
+            for i, row in enumerate(st.session_state.schedules):
                 with st.expander(f"Schedule {i+1}: {row['Day']} {row['Start Time']} to {row['End Time']}"):
                     cols = st.columns([4, 1])
                     cols[0].write(f"""
@@ -281,32 +294,38 @@ st.markdown("### System Status")
 with st.container():
     status_cols = st.columns(3)
     
+    # Fetch device status once and share it across the status columns
+    status, status_error = None, None
+    if device_up(DEV.ip):
+        try:
+            status = fetch_json(DEV.status_url)
+        except Exception as e:
+            status_error = e
+    
     with status_cols[0]:
         st.markdown("**Device Connection**")
-        try:
-            response = requests.get(STATUS_URL, timeout=5)
-            if response.status_code == 200:
-                st.success("✅ Connected")
-            else:
-                st.warning("⚠️ Connection issues")
-        except:
+        if status is not None:
+            st.success("✅ Connected")
+        elif isinstance(status_error, (requests.HTTPError, ValueError)):
+            st.warning("⚠️ Connection issues")
+        else:
             st.error("❌ Device offline")
     
     with status_cols[1]:
         st.markdown("**Last Update**")
-        st.write(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        if st.session_state.last_update is not None:
+            st.write(st.session_state.last_update.strftime("%Y-%m-%d %H:%M:%S"))
+        else:
+            st.write("Never")
     
     with status_cols[2]:
         st.markdown("**System Uptime**")
         try:
-            response = requests.get(STATUS_URL, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                uptime = data.get("uptime", 0)
-                hours = uptime // 3600
-                minutes = (uptime % 3600) // 60
-                st.write(f"{hours}h {minutes}m")
-        except:
+            uptime = status.get("uptime", 0)
+            hours = uptime // 3600
+            minutes = (uptime % 3600) // 60
+            st.write(f"{hours}h {minutes}m")
+        except (AttributeError, TypeError, ValueError):
             st.write("Unknown")
 
 # Initialize device status on first run
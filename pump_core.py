@@ -0,0 +1,56 @@
+import streamlit as st
+import requests
+from requests.adapters import HTTPAdapter
+import socket
+from dataclasses import dataclass
+
+# Device configuration
+@dataclass(frozen=True)
+class Device:
+    ip: str
+
+    @property
+    def base_url(self):
+        return f"http://{self.ip}"
+
+    @property
+    def pump_on_url(self):
+        return f"{self.base_url}/pump_on"
+
+    @property
+    def pump_off_url(self):
+        return f"{self.base_url}/pump_off"
+
+    @property
+    def status_url(self):
+        return f"{self.base_url}/status"
+
+    @property
+    def moisture_url(self):
+        return f"{self.base_url}/moisture"
+
+# Replace with your ESP8266 IP
+DEV = Device(ip="192.168.1.100")
+
+# Shared HTTP session so requests to the device reuse a keep-alive connection
+@st.cache_resource
+def get_http_session():
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0))
+    return session
+
+# Fetch JSON from the device, cached briefly so reruns in a burst share one request
+@st.cache_data(ttl=2, show_spinner=False)
+def fetch_json(url):
+    response = get_http_session().get(url, timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+# Quick TCP probe so an offline device fails fast instead of waiting out HTTP timeouts
+@st.cache_data(ttl=5, show_spinner=False)
+def device_up(ip, port=80):
+    try:
+        socket.create_connection((ip, port), timeout=0.5).close()
+        return True
+    except OSError:
+        return False